@@ -0,0 +1,240 @@
+#
+#    Copyright (C) <2012>  <cummings.evan@gmail.com>
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# DupFind.py
+# Near-duplicate detection with bit-packed color signatures.
+#
+# Each image gets a 128-bit signature, one bit for each of the 64
+# color-code and 25 intensity bins, set when the bin is above the
+# median of that bin over the library.  The 89 bits are split into
+# chunks, each with a hash table from chunk value to images, so the
+# images within a Hamming radius are found without a full scan
+# (multi-index hashing).  The candidates are then verified with the
+# exact histogram Manhattan distance of ImageViewer.find_color_distance.
+#
+# The chunks are about log2(N) bits wide for N images, so each table
+# has about N buckets, and each chunk is probed within radius/chunks
+# bits.  Neighbouring bins are correlated, so the bits are dealt out
+# to the chunks in turn rather than in runs.  The chunks are sized
+# for the library at construction; images added later share them.
+
+# Usage:
+#   "python DupFind.py" runs the all-pairs duplicate sweep and checks
+#   it against the quadratic sweep.
+
+import itertools, math, time
+import numpy as np
+
+# Bits set in each byte:
+popCount = np.array([bin(b).count('1') for b in range(256)], dtype=int)
+
+
+# Duplicate finder class.
+class DupFind:
+
+  # Constructor.
+  #   pixInfo = the index to find duplicates in
+  #   radius  = largest Hamming distance between candidates
+  #   maxDist = largest color-code and intensity distance between
+  #             duplicates
+  #   chunks  = number of hash tables, by default enough for chunks
+  #             of about log2(N) bits
+  #   floor   = smallest bin threshold, so that near empty bins
+  #             do not flip their bits on noise
+  def __init__(self, pixInfo, radius=8, maxDist=0.1, chunks=None,
+               floor=0.005):
+
+    self.radius = radius
+    self.maxDist = maxDist
+
+    imageList = pixInfo.get_imageList()
+    sizes = [im.size for im in imageList]
+    hists = [self.norm_hist(CcBins, InBins, size) for CcBins, InBins, size
+             in zip(pixInfo.get_colorCode(), pixInfo.get_intenCode(), sizes)]
+
+    # Median of each bin over the library:
+    if len(hists) > 0:
+      median = np.median(np.array(hists), axis=0)
+    else:
+      median = np.zeros(64 + 25)
+    self.median = np.maximum(median, floor)
+    self.nbits = len(self.median)
+
+    # Chunks of about log2(N) bits, each probed within chunkRad bits
+    # so that candidates within the radius share at least one:
+    if chunks is None:
+      width = max(1, int(round(math.log(max(len(hists), 2), 2))))
+      chunks = int(math.ceil(self.nbits / float(width)))
+    chunks = max(1, min(chunks, self.nbits))
+    self.chunkRad = radius // chunks
+
+    self.histList = []
+    self.sigList = []
+    self.tables = [{} for c in range(chunks)]
+    for hist in hists:
+      self.add_hist(hist)
+
+
+  # Histograms as a fraction of the pixels in the image:
+  def norm_hist(self, CcBins, InBins, size):
+
+    pixels = float(size[0] * size[1])
+    return np.array(list(CcBins) + list(InBins), dtype=float) / pixels
+
+
+  # Add an image to the index, returns its index:
+  def add_image(self, CcBins, InBins, size):
+
+    return self.add_hist(self.norm_hist(CcBins, InBins, size))
+
+
+  # Add a normalized histogram to the index:
+  def add_hist(self, hist):
+
+    k = len(self.sigList)
+    bits = hist > self.median
+    self.histList.append(hist)
+    self.sigList.append(self.encode(bits))
+    for c, key in enumerate(self.chunk_keys(bits)):
+      self.tables[c].setdefault(key, []).append(k)
+    return k
+
+
+  # Pack the signature bits into a 128-bit (16 byte) word:
+  def encode(self, bits):
+
+    word = np.zeros(128, dtype=bool)
+    word[:len(bits)] = bits
+    return np.packbits(word)
+
+
+  # The integer value of each chunk of the signature, chunk c has
+  # bits c, c + chunks, c + 2*chunks, ...:
+  def chunk_keys(self, bits):
+
+    keys = []
+    chunks = len(self.tables)
+    for c in range(chunks):
+      key = 0
+      for b in bits[c::chunks]:
+        key = key << 1 | int(b)
+      keys.append(key)
+    return keys
+
+
+  # Every key within the chunk radius of a chunk key:
+  def probe_keys(self, key, width):
+
+    keys = [key]
+    for r in range(1, self.chunkRad + 1):
+      for flip in itertools.combinations(range(width), r):
+        probe = key
+        for b in flip:
+          probe ^= 1 << b
+        keys.append(probe)
+    return keys
+
+
+  # Find the candidate duplicates of image i, those within the
+  # Hamming radius of its signature:
+  def find_cands(self, i):
+
+    bits = np.unpackbits(self.sigList[i])[:self.nbits].astype(bool)
+    cands = set()
+    chunks = len(self.tables)
+    for c, key in enumerate(self.chunk_keys(bits)):
+      width = len(range(c, self.nbits, chunks))
+      for probe in self.probe_keys(key, width):
+        cands.update(self.tables[c].get(probe, []))
+    cands.discard(i)
+    cands = sorted(cands)
+    if len(cands) == 0:
+      return cands
+
+    # Keep the candidates within the radius over the whole signature:
+    sigs = np.array([self.sigList[k] for k in cands])
+    dist = popCount[sigs ^ self.sigList[i]].sum(axis=1)
+    return [k for k, d in zip(cands, dist) if d <= self.radius]
+
+
+  # Find the duplicates of image i, verified with the exact
+  # color-code and intensity distances, only those after i if
+  # after is set:
+  # Returns a list of (index, ccDist, inDist) tuples.
+  def find_dups(self, i, after=False):
+
+    dups = []
+    hist = self.histList[i]
+    for k in self.find_cands(i):
+      if after and k <= i:
+        continue
+      diff = np.abs(self.histList[k] - hist)
+      ccDist = np.sum(diff[:64])
+      inDist = np.sum(diff[64:])
+      if ccDist <= self.maxDist and inDist <= self.maxDist:
+        dups.append((k, ccDist, inDist))
+    return dups
+
+
+  # Find every pair of duplicates:
+  # Returns a list of (i, k, ccDist, inDist) tuples with i < k.
+  def find_all_dups(self):
+
+    pairs = []
+    for i in range(len(self.sigList)):
+      for k, ccDist, inDist in self.find_dups(i, after=True):
+        pairs.append((i, k, ccDist, inDist))
+    return pairs
+
+
+# Executable section.
+if __name__ == '__main__':
+
+  from PixInfo import PixInfo
+
+  pixInfo = PixInfo(thumbs=False)
+  dupFind = DupFind(pixInfo)
+  fileList = [im.filename for im in pixInfo.get_imageList()]
+  n = len(fileList)
+
+  t = time.time()
+  pairs = dupFind.find_all_dups()
+  fast = time.time() - t
+  cands = sum(len(dupFind.find_cands(i)) for i in range(n)) / 2
+
+  # The quadratic sweep for comparison:
+  t = time.time()
+  exact = []
+  hists = np.array(dupFind.histList)
+  for i in range(n):
+    diff = np.abs(hists[i+1:] - hists[i])
+    ccDist = np.sum(diff[:,:64], axis=1)
+    inDist = np.sum(diff[:,64:], axis=1)
+    for k in np.nonzero((ccDist <= dupFind.maxDist) &
+                        (inDist <= dupFind.maxDist))[0]:
+      exact.append((i, i+1+k))
+  slow = time.time() - t
+
+  for i, k, ccDist, inDist in pairs:
+    print('%s %s %.4f %.4f' % (fileList[i], fileList[k], ccDist, inDist))
+  found = len(set(exact).intersection((i, k) for i, k, c, d in pairs))
+  print('%d pairs, %d candidates of %d, %.3f s' %
+        (len(pairs), cands, n*(n-1)/2, fast))
+  recall = 'n/a'
+  if len(exact) > 0:
+    recall = '%.3f' % (found / float(len(exact)))
+  print('quadratic sweep %d pairs, %.3f s, recall %s' %
+        (len(exact), slow, recall))
@@ -0,0 +1,246 @@
+#
+#    Copyright (C) <2012>  <cummings.evan@gmail.com>
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# FeatReduce.py
+# Reduced feature space for faster distance scans.
+#
+# The 92 normalized features (3 texture, 64 color-code, 25 intensity)
+# of one relevance feedback method are weighted, as in the exact
+# weighted Manhattan distance of ImageViewer.find_rel_distance, and
+# projected onto a smaller space with either PCA or a sparse random
+# projection.  Queries scan the reduced matrix, and the top
+# candidates may be re-ranked with the exact distance.
+#
+# PCA preserves the Euclidean distance, so its scan is Euclidean;
+# the sparse random projection scan is Manhattan, which matches the
+# exact distance better.  The recall against the exact distance
+# therefore mixes the loss from the metric with the loss from the
+# dimension; scan_recall() measures the latter alone, against the
+# same scan over the full weighted features.
+
+# Usage:
+#   "python FeatReduce.py" prints the recall, scan time and index
+#   size for a range of target dimensions, with the exact scan time
+#   for comparison.
+
+import math, time
+import numpy as np
+
+
+# Feature reduction class.
+class FeatReduce:
+
+  # Constructor.
+  #   normFeatMat = normalized feature matrix from PixInfo
+  #   dim         = target dimension
+  #   method      = 'pca' or 'rp' (sparse random projection)
+  #   length      = features of the relevance feedback method
+  #   weight      = feature weights, 1 / N by default
+  #   seed        = seed for the random projection
+  def __init__(self, normFeatMat, dim=16, method='pca', length=range(0,92),
+               weight=None, seed=0):
+
+    self.normFeatMat = np.array(normFeatMat, dtype=float)
+    self.method = method
+    self.length = np.asarray(length)
+    self.dimMax = dim
+    self.seed = seed
+    if method not in ['pca', 'rp']:
+      raise ValueError('unknown reduction method: %s' % method)
+    if weight is None:
+      weight = [1 / float(len(self.normFeatMat))]*92
+    self.weight = None
+    self.set_weight(weight)
+
+
+  # Set the feature weights, refitting the projection if they have
+  # changed, e.g. after relevance feedback:
+  def set_weight(self, weight):
+
+    weight = np.asarray(weight, dtype=float)
+    if self.weight is not None and np.array_equal(weight, self.weight):
+      return
+    self.weight = weight.copy()
+
+    # Weighted features of the method, the Manhattan distance between
+    # these rows is the exact distance:
+    self.featMat = self.normFeatMat[:,self.length] * weight[self.length]
+    n, d = self.featMat.shape
+
+    # PCA, the projection is the leading right-singular vectors
+    # of the centered feature matrix:
+    if self.method == 'pca':
+      self.mean = np.mean(self.featMat, axis=0)
+      U, S, Vt = np.linalg.svd(self.featMat - self.mean,
+                               full_matrices=False)
+      self.dim = min(self.dimMax, Vt.shape[0])
+      self.proj = Vt[:self.dim].T
+
+    # Sparse random projection (Achlioptas), entries are
+    # +-sqrt(s/dim) with probability 1/(2s) each and 0 otherwise,
+    # with s = sqrt(d):
+    else:
+      self.mean = np.zeros(d)
+      self.dim = self.dimMax
+      s = math.sqrt(d)
+      rand = np.random.RandomState(self.seed).uniform(size=(d, self.dim))
+      self.proj = np.zeros((d, self.dim))
+      self.proj[rand < 1 / (2*s)] = -1
+      self.proj[rand > 1 - 1 / (2*s)] = 1
+      self.proj *= math.sqrt(s / self.dim)
+
+    # The reduced index is stored in single precision, only the
+    # re-rank touches the full matrix:
+    self.redMat = np.dot(self.featMat - self.mean,
+                         self.proj).astype(np.float32)
+
+
+  # Scan distance from row vector vec to each row of mat, Euclidean
+  # (squared) for PCA and Manhattan for the random projection:
+  def scan_distance(self, mat, vec):
+
+    diff = np.abs(mat - vec)
+    if self.method == 'pca':
+      diff *= diff
+    return np.sum(diff, axis=1)
+
+
+  # Exact weighted Manhattan distance from image i to each image
+  # in rows, all images by default:
+  def exact_distance(self, i, rows=None):
+
+    if rows is None:
+      imgk = self.featMat
+    else:
+      imgk = self.featMat[rows]
+    return np.sum(np.abs(imgk - self.featMat[i]), axis=1)
+
+
+  # The m smallest distances, sorted, ties in index order:
+  def top_order(self, dist, m=None):
+
+    if m is None or m >= len(dist):
+      return np.argsort(dist, kind='mergesort')
+    top = np.argpartition(dist, m - 1)[:m]
+    return top[np.lexsort((top, dist[top]))]
+
+
+  # Find the distance in the reduced space:
+  #   i      = query image index
+  #   k      = number of results, all images by default
+  #   rerank = number of leading candidates re-ranked with the
+  #            exact weighted distance, 0 for none
+  # Returns a list of (index, distance) tuples in order.  With a
+  # re-rank, the re-ranked candidates carry the exact distance and
+  # the rest None, as their scan distances are in other units.
+  def find_distance(self, i, k=None, rerank=0):
+
+    dist = self.scan_distance(self.redMat, self.redMat[i])
+    m = k
+    if k is not None:
+      m = max(k, rerank)
+    order = self.top_order(dist, m)
+
+    if rerank > 0:
+      cand = order[:rerank]
+      exact = self.exact_distance(i, cand)
+      rankOrder = np.lexsort((cand, exact))
+      distanceTup = [(int(cand[j]), float(exact[j])) for j in rankOrder]
+      distanceTup += [(int(j), None) for j in order[rerank:k]]
+    else:
+      distanceTup = [(int(j), float(dist[j])) for j in order[:k]]
+    return distanceTup[:k]
+
+
+  # Mean recall of the top k reduced results against the top k
+  # exact results, taking every image as a query:
+  def recall(self, k, rerank=0):
+
+    hits = 0
+    n = self.featMat.shape[0]
+    for i in range(n):
+      exactSet = set(self.top_order(self.exact_distance(i), k).tolist())
+      redTup = self.find_distance(i, k, rerank)
+      hits += len(exactSet.intersection([tup[0] for tup in redTup]))
+    return hits / float(k*n)
+
+
+  # Mean recall of the top k reduced results against the same scan
+  # over the full weighted features, the loss from the dimension:
+  def scan_recall(self, k):
+
+    hits = 0
+    n = self.featMat.shape[0]
+    fullMat = self.featMat - self.mean
+    for i in range(n):
+      fullDist = self.scan_distance(fullMat, fullMat[i])
+      fullSet = set(self.top_order(fullDist, k).tolist())
+      redTup = self.find_distance(i, k)
+      hits += len(fullSet.intersection([tup[0] for tup in redTup]))
+    return hits / float(k*n)
+
+
+  # Accessor functions:
+  def get_dim(self):
+    return self.dim
+
+  def get_redMat(self):
+    return self.redMat
+
+
+# Executable section.
+if __name__ == '__main__':
+
+  from PixInfo import PixInfo
+
+  pixInfo = PixInfo(thumbs=False)
+  normFeatMat = pixInfo.get_normFeatMat()
+  n = len(normFeatMat)
+  k = 10
+  rerank = 3*k
+  reps = 20
+
+  # Time the exact scan, top k from the weighted distance:
+  featReduce = FeatReduce(normFeatMat, 92, 'pca')
+  t = time.time()
+  for r in range(reps):
+    for i in range(n):
+      featReduce.top_order(featReduce.exact_distance(i), k)
+  exactMs = 1000 * (time.time() - t) / (reps*n)
+
+  fullBytes = np.array(normFeatMat).nbytes
+  print('%d images, full index %d bytes, exact scan %.3f ms/query' %
+        (n, fullBytes, exactMs))
+  print('%-4s %4s %9s %9s %9s %9s %9s %9s' %
+        ('meth', 'dim', 'bytes', 'scanRcl', 'recall', 'rerank',
+         'ms/query', 'ms/rrank'))
+
+  for method in ['pca', 'rp']:
+    for dim in [4, 8, 16, 32, 64, 92]:
+      featReduce = FeatReduce(normFeatMat, dim, method)
+      times = []
+      for rr in [0, rerank]:
+        t = time.time()
+        for r in range(reps):
+          for i in range(n):
+            featReduce.find_distance(i, k, rr)
+        times.append(1000 * (time.time() - t) / (reps*n))
+      print('%-4s %4d %9d %9.3f %9.3f %9.3f %9.3f %9.3f' %
+            (method, featReduce.get_dim(),
+             featReduce.get_redMat().nbytes,
+             featReduce.scan_recall(k),
+             featReduce.recall(k),
+             featReduce.recall(k, rerank), times[0], times[1]))
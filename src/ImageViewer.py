@@ -41,6 +41,7 @@
 from Tkinter import *
 import math, os
 from PixInfo import PixInfo
+from FeatReduce import FeatReduce
 import numpy as np
 
 
@@ -75,6 +76,16 @@ class ImageViewer(Frame):
             self.var.append(IntVar())
         # Weighting vector:
         self.weight = [1 / float(len(self.normFeatMat))]*92
+        # Reduced feature space for each method, the top candidates 
+        # are re-ranked with the exact weighted distance.
+        self.rdc = IntVar()
+        self.featReduce = {}
+        for method, length in [('CCT', range(0,67)),
+                               ('CCI', range(3,92)),
+                               ('CCTI', range(0,92))]:
+            self.featReduce[method] = FeatReduce(self.normFeatMat, 
+                dim=16, length=length, weight=self.weight)
+        self.rerank = 20
                 
         
         # Create Main frame.
@@ -176,6 +187,13 @@ class ImageViewer(Frame):
                             offvalue=0)
         check.grid(row=4, column=1, sticky=W)
         
+        rdcCheck = Checkbutton(controlFrame,
+                               text='Reduced',
+                               variable=self.rdc,
+                               onvalue=1,
+                               offvalue=0)
+        rdcCheck.grid(row=5, column=1, sticky=W)
+        
         # Layout Preview.
         self.selectImg = Label(previewFrame, 
             image=self.photoList[0])
@@ -251,6 +269,17 @@ class ImageViewer(Frame):
         # imgi = query image
         # imgk = comparison image
         i = self.list.index(ACTIVE)
+        
+        # Scan the reduced space if selected, refit to the
+        # current weights:
+        if self.rdc.get() == 1:
+            featReduce = self.featReduce[method]
+            featReduce.set_weight(self.weight)
+            sortedTup = featReduce.find_distance(i, 
+                rerank=self.rerank)
+            self.update_results(sortedTup)
+            return
+        
         imgi = self.normFeatMat[i]
         distanceTup = []
         # For each relevant image,
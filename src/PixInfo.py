@@ -21,6 +21,7 @@
 # Ideally written in C for speed optimization.
 
 from PIL import Image, ImageTk
+from fractions import Fraction
 import glob, os, math
 import numpy as np
 
@@ -29,8 +30,19 @@ import numpy as np
 class PixInfo:
   
   # Constructor.
-  def __init__(self):
+  #   thumbs   = build the Tk thumbnails for the GUI, may be turned
+  #              off when there is no Tk root (batch jobs, benchmarks).
+  #   texExtra = also calculate the homogeneity, correlation and
+  #              dissimilarity texture features.
+  #   files    = image files to add, images/*.jpg by default.
+  #   normalize = build the normalized feature matrix, may be
+  #               turned off when the statistics come from elsewhere,
+  #               e.g. merged over shards.
+  def __init__(self, thumbs=True, texExtra=False, files=None,
+               normalize=True):
     
+    self.thumbs = thumbs
+    self.texExtra = texExtra
     self.imageList = []
     self.photoList = []
     self.xmax = 0
@@ -43,73 +55,140 @@ class PixInfo:
     self.energyList = []
     self.entropyList = []
     self.contrastList = []
+    self.homogeneityList = []
+    self.correlationList = []
+    self.dissimilarityList = []
     self.featureMat = []
     self.normFeatMat = []
     
     # Add each image (for evaluation) into a list, 
     # and a Photo from the image (for the GUI) in a list.
-    for infile in glob.glob('images/*.jpg'):
-      
-      file, ext = os.path.splitext(infile)
-      im = Image.open(infile)
+    if files is None:
+      files = glob.glob('images/*.jpg')
+    for infile in files:
+      self.add_image(infile)
+    
+    # Gaussian normalization on features within matrix:
+    if normalize:
+      self.normalize()
+  
+  
+  # Add an image function, loads the image and its thumbnail and
+  # appends its features.  Everything is calculated before any list
+  # is changed, so an image that fails leaves the index as it was.
+  # The normalized feature matrix is not updated until normalize()
+  # is called.
+  def add_image(self, infile):
       
-      # Resize the image for thumbnails.
-      imSize = im.size
-      x = imSize[0]/4
-      y = imSize[1]/4
+    file, ext = os.path.splitext(infile)
+    im = Image.open(infile)
+    
+    # Resize the image for thumbnails.
+    imSize = im.size
+    x = imSize[0]/4
+    y = imSize[1]/4
+    if self.thumbs:
       imResize = im.resize((x, y), Image.ANTIALIAS)
       photo = ImageTk.PhotoImage(imResize)
-      
-      # Find the max height and width of the set of pics.
-      if x > self.xmax:
-        self.xmax = x
-      if y > self.ymax:
-        self.ymax = y
-      
-      # Add the images to the lists.
-      self.imageList.append(im)
-      self.photoList.append(photo)
+    else:
+      photo = None
 
-    # Create a list of pixel data for each image and add it
-    # to a list.
-    for im in self.imageList:
-      CcBins, InBins = self.encode(im)
-      GsImg = self.gs_encode(im)
-      CoMat = self.coMat_encode(GsImg)
-      normMat = self.norm_mat(CoMat)
-      energy, entropy, contrast = self.calc_tex_feat(normMat)
-      self.energyList.append(energy)
-      self.entropyList.append(entropy)
-      self.contrastList.append(contrast)
-      self.colorCode.append(CcBins)
-      self.intenCode.append(InBins)
-      self.gsImgList.append(GsImg)
-      self.coMatList.append(CoMat)
-      self.normMatList.append(normMat)
-          
-    # Create a feature matrix from the texture features:
-    for i in range(len(self.energyList)):
-      self.normFeatMat.append([])
-      self.normFeatMat[i].append(self.energyList[i])
-      self.normFeatMat[i].append(self.entropyList[i])
-      self.normFeatMat[i].append(self.contrastList[i])
-      for j in range(len(self.colorCode[i])):
-        self.normFeatMat[i].append(self.colorCode[i][j])
-      for j in range(len(self.intenCode[i])):
-        self.normFeatMat[i].append(self.intenCode[i][j])
-    self.normFeatMat = np.mat(self.normFeatMat)  
+    # Create the pixel data for the image.
+    CcBins, InBins = self.encode(im)
+    GsImg = self.gs_encode(im)
+    CoMat = self.coMat_encode(GsImg)
+    normMat = self.norm_mat(CoMat)
+    texFeat = self.calc_tex_feat(normMat, self.texExtra)
+    energy, entropy, contrast = texFeat[:3]
     
-    # Gaussian normalization on features within matrix:
-    for j in range(self.normFeatMat.shape[1]):
-      mean = np.mean(self.normFeatMat[:,j])
-      std = np.std(self.normFeatMat[:,j])
-      for i in range(self.normFeatMat.shape[0]):
-        if std == 0:
-          self.normFeatMat[i,j] = 0
+    # The un-normalized feature vector:
+    featVec = [energy, entropy, contrast]
+    featVec.extend(CcBins)
+    featVec.extend(InBins)
+    
+    # Find the max height and width of the set of pics.
+    if x > self.xmax:
+      self.xmax = x
+    if y > self.ymax:
+      self.ymax = y
+    
+    # Add the image and its features to the lists.
+    self.imageList.append(im)
+    self.photoList.append(photo)
+    if self.texExtra:
+      self.homogeneityList.append(texFeat[3])
+      self.correlationList.append(texFeat[4])
+      self.dissimilarityList.append(texFeat[5])
+    self.energyList.append(energy)
+    self.entropyList.append(entropy)
+    self.contrastList.append(contrast)
+    self.colorCode.append(CcBins)
+    self.intenCode.append(InBins)
+    self.gsImgList.append(GsImg)
+    self.coMatList.append(CoMat)
+    self.normMatList.append(normMat)
+    self.featureMat.append(featVec)
+  
+  
+  # Column statistics function, the count, mean and sum of squared
+  # deviations (M2) of each feature.  These are held exactly as
+  # fractions, so the statistics merged over several indexes with 
+  # merge_stats() are the same as those of one index of all images.
+  # The histogram columns are integers, so their sums are exact in
+  # integers.  The texture columns are summed exactly as integers
+  # over their common power of two denominator.
+  def calc_stats(self):
+    
+    count = len(self.featureMat)
+    if count == 0:
+      return 0, [], []
+    featMat = np.array(self.featureMat, dtype=float)
+    mean = []
+    M2 = []
+    for col in featMat.T:
+      
+      # Sum and sum of squares, in int64 unless that may overflow:
+      if np.all(col == np.floor(col)) and np.max(np.abs(col)) < 2**53:
+        ints = col.astype(np.int64)
+        S = int(np.sum(ints))
+        if int(np.max(np.abs(ints)))**2 * count < 2**62:
+          Q = int(np.dot(ints, ints))
         else:
-          self.normFeatMat[i,j] = (self.normFeatMat[i,j] - 
-                                   mean) / std
-    self.normFeatMat = self.normFeatMat.tolist()
+          Q = sum(int(v)**2 for v in ints)
+      else:
+        ratios = [v.as_integer_ratio() for v in col.tolist()]
+        shift = max(d for n, d in ratios).bit_length() - 1
+        shifts = [shift - d.bit_length() + 1 for n, d in ratios]
+        S = Fraction(sum(n << s for (n, d), s in zip(ratios, shifts)),
+                     1 << shift)
+        Q = Fraction(sum(n*n << 2*s for (n, d), s in zip(ratios, shifts)),
+                     1 << 2*shift)
+      
+      # M2 = sum((v - mean)**2) = Q - S**2/count:
+      mean.append(Fraction(S) / count)
+      M2.append(Q - Fraction(S)**2 / count)
+    return count, mean, M2
+  
+  
+  # Gaussian normalization function, rebuilds the normalized
+  # feature matrix from the feature matrix.  The statistics are
+  # those of this index unless given, e.g. merged over shards.
+  def normalize(self, stats=None):
+    
+    if stats is None:
+      stats = self.calc_stats()
+    count, mean, M2 = stats
+    mean = np.array([float(m) for m in mean])
+    std = np.array([math.sqrt(m2 / count) for m2 in M2])
+    
+    # Gaussian normalization on features within matrix,
+    # features with std = 0 are 0:
+    featMat = np.array(self.featureMat, dtype=float)
+    featMat = featMat.reshape(len(self.featureMat), len(mean))
+    normFeatMat = np.zeros(featMat.shape)
+    nz = std != 0
+    normFeatMat[:,nz] = (featMat[:,nz] - mean[nz]) / std[nz]
+    self.normFeatMat = normFeatMat.tolist()
   
 
   # Bin function returns an array of bins for each 
@@ -159,58 +238,39 @@ class PixInfo:
     x = imSize[0]
     y = imSize[1]
     
-    # List of pixel Information [R, G, B]
-    pixList = list(im.getdata())
+    # Array of pixel Information [R, G, B], in the same order
+    # as the pixel list, taken x rows of y pixels:
+    pixArr = np.asarray(im, dtype=float).reshape(x, y, -1)
     
-    # Create the two-dimensional List of gray-scale 
+    # Create the two-dimensional array of gray-scale 
     #   intensity values:
-    GsImg = []
-    k = 0
-    for i in range(x):
-      GsImg.append([])
-      for j in range(y):
-        pix = pixList[k]
-        R = 0.299*pix[0]
-        B = 0.587*pix[1]
-        G = 0.114*pix[2]
-        I = int(math.floor(R + G + B))
-        GsImg[i].append(I)
-        k += 1
+    R = 0.299*pixArr[:,:,0]
+    B = 0.587*pixArr[:,:,1]
+    G = 0.114*pixArr[:,:,2]
+    GsImg = np.floor(R + G + B).astype(int)
     
-    # Return the gray scale image in list form.
+    # Return the gray scale image in array form.
     return GsImg
   
   
   # Gray-scale co-occurrence matrix function:
   def coMat_encode(self, GsImg):
       
-    # Initialize the set of possible values to 0:
-    set = []
-    for i in GsImg:
-      for j in i:
-        if set.count(j) == 0:
-          set.append(j)
-    set.sort()
+    # The sorted set of possible values, and the index of each
+    # pixel value within the set from a lookup table:
+    GsImg = np.asarray(GsImg)
+    counts = np.bincount(GsImg.ravel())
+    values = np.nonzero(counts)[0]
+    lookup = np.cumsum(counts > 0) - 1
+    index = lookup[GsImg]
     
-    # Create co-occurance matrix:
-    CoMat = []
-    l = len(set)
-    dr = dc = 1
-    # Initialization:
-    for i in range(l):
-      CoMat.append([])
-      for j in range(l):
-        CoMat[i].append(0)
-    # Create with rule:
+    # Create co-occurance matrix with rule:
     # C[i,j] = { [r,c] | I[r,c] = i and I[r+dr, c+dc] = j }
-    x = len(GsImg)
-    y = len(GsImg[0])
-    for r in range(x):
-      for c in range(y):
-        i = GsImg[r][c]
-        if r+dr < x and c+dc < y:
-          j = GsImg[r+dr][c+dc]
-          CoMat[set.index(i)][set.index(j)] += 1
+    l = len(values)
+    dr = dc = 1
+    i = index[:-dr,:-dc].ravel()
+    j = index[dr:,dc:].ravel()
+    CoMat = np.bincount(i*l + j, minlength=l*l).reshape(l, l)
         
     # Return the co-occurrance matrix:
     return CoMat
@@ -218,46 +278,43 @@ class PixInfo:
   # Normalize co-occurance matrix function:
   def norm_mat(self, CoMat):
     
-    # Initialize the norm matrix and calculate the sum:
-    normMat = []
-    sum = 0
-    x = len(CoMat)
-    y = len(CoMat[0])
-    for i in range(x):
-      normMat.append([])
-      for j in range(y):
-        normMat[i].append(0)
-        sum += CoMat[i][j]
-    
-    # Create the normalized matrix and texture features:
-    for i in range(x):
-      for j in range(y):
-        normMat[i][j] = CoMat[i][j] / float(sum)
-    
     # Return the normalized co-occurance matrix:
-    return normMat
+    CoMat = np.asarray(CoMat)
+    return CoMat / float(np.sum(CoMat))
   
   
-  # Calculate texture features function:
-  def calc_tex_feat(self, normMat):
+  # Calculate texture features function, the extra features are
+  # homogeneity, correlation and dissimilarity:
+  def calc_tex_feat(self, normMat, extra=False):
   
-    # Calculate the features at once:
-    energy = 0
-    entropy = 0
-    contrast = 0
-    sum = 0
-    x = len(normMat)
-    y = len(normMat[0])
-    for i in range(x):
-      for j in range(y):
-        n = normMat[i][j]
-        if n > 0:
-          energy += n**2
-          entropy += n * math.log(n, 2)
-          contrast += n * (i - j)**2
+    # Only the non-zero entries contribute, so take the index 
+    # grids of those once and calculate the features at once:
+    normMat = np.asarray(normMat)
+    i, j = np.nonzero(normMat)
+    n = normMat[i,j]
+    d = i - j
+    energy = float(np.sum(n**2))
+    entropy = float(np.sum(n * np.log2(n)))
+    contrast = float(np.sum(n * d**2))
+    if not extra:
+      return energy, entropy, contrast
+    
+    # Extra features from the same grids:
+    homogeneity = float(np.sum(n / (1.0 + d**2)))
+    dissimilarity = float(np.sum(n * np.abs(d)))
+    meanI = np.sum(n * i)
+    meanJ = np.sum(n * j)
+    stdI = math.sqrt(np.sum(n * (i - meanI)**2))
+    stdJ = math.sqrt(np.sum(n * (j - meanJ)**2))
+    if stdI == 0 or stdJ == 0:
+      correlation = 1.0
+    else:
+      correlation = float(np.sum(n * (i - meanI) * (j - meanJ)) / 
+                          (stdI * stdJ))
     
     # Return the features:
-    return energy, entropy, contrast
+    return (energy, entropy, contrast, 
+            homogeneity, correlation, dissimilarity)
 
   
   # Accessor functions:
@@ -294,6 +351,18 @@ class PixInfo:
   def get_contrastList(self):
     return self.contrastList
 
+  def get_homogeneityList(self):
+    return self.homogeneityList
+
+  def get_correlationList(self):
+    return self.correlationList
+
+  def get_dissimilarityList(self):
+    return self.dissimilarityList
+
+  def get_featureMat(self):
+    return self.featureMat
+
   def get_normFeatMat(self):
     return self.normFeatMat
 
@@ -301,3 +370,24 @@ class PixInfo:
     return self.normMatList
 
 
+# Merge column statistics function, combines the statistics from
+# calc_stats() of two sets of images (Chan et al.), exactly.
+def merge_stats(a, b):
+  
+  na, meanA, M2a = a
+  nb, meanB, M2b = b
+  if na == 0:
+    return b
+  if nb == 0:
+    return a
+  
+  n = na + nb
+  mean = []
+  M2 = []
+  for j in range(len(meanA)):
+    delta = meanB[j] - meanA[j]
+    mean.append(meanA[j] + delta * nb / n)
+    M2.append(M2a[j] + M2b[j] + delta**2 * na * nb / n)
+  return n, mean, M2
+
+
@@ -0,0 +1,150 @@
+#
+#    Copyright (C) <2012>  <cummings.evan@gmail.com>
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# PixQuery.py
+# Similar-image queries over a PixInfo index without the GUI.
+#
+# A PixQuery is a read-only snapshot of the features in a PixInfo,
+# so it may be shared between threads.  The distance methods are
+# the same as the ImageViewer buttons, vectorized over the images.
+# The distance to each image is independent of the other images in
+# the index, so results from several shards may be merged exactly.
+
+import numpy as np
+
+
+# Methods and the features each one uses:
+texMethods = {'energy' : 0, 'entropy' : 1, 'contrast' : 2}
+relMethods = {'CCT'  : range(0,67),
+              'CCI'  : range(3,92),
+              'CCTI' : range(0,92)}
+colorMethods = {'CC' : 'colorCode', 'inten' : 'intenCode'}
+
+
+# Calculate the weight from the features of the relevant images,
+# following the rule of ImageViewer.update_weight:
+#   Wi = 1/std(i); Wi = Wi/sum(Wi)
+# If mean and std of feature i are both zero, Wi = 0.  If std(i)
+# is zero, but mean(i) is not, std(i) = 0.5*min(non-zero features).
+# With no relevant images, Wi = 1 / N for N images.
+def rel_weight(relImgMat, n, d=92):
+
+  if len(relImgMat) == 0:
+    return np.array([1 / float(n)]*d)
+
+  relImgMat = np.asarray(relImgMat, dtype=float)
+  relImgMatMask = np.ma.masked_values(relImgMat, 0)
+  std = np.std(relImgMat, axis=0)
+  mean = np.mean(relImgMat, axis=0)
+  minStd = 0.5*np.ma.filled(np.min(relImgMatMask, axis=0), 0)
+
+  weight = np.zeros(relImgMat.shape[1])
+  nz = std != 0
+  weight[nz] = 1 / std[nz]
+  zm = (std == 0) & (mean != 0)
+  weight[zm] = 1 / minStd[zm]
+  return weight / np.sum(weight)
+
+
+# Pixel query class.
+class PixQuery:
+
+  # Constructor, copies the features out of the PixInfo.
+  def __init__(self, pixInfo):
+
+    imageList = pixInfo.get_imageList()
+    self.fileList = [im.filename for im in imageList]
+
+    # Features are stored by column for the distance sums:
+    featMat = np.array(pixInfo.get_normFeatMat(), dtype=float)
+    self.featCols = featMat.T.copy()
+    self.normFeatMat = self.featCols.T
+
+    # Histograms as a fraction of the pixels in each image:
+    pixels = np.array([float(im.size[0] * im.size[1])
+                       for im in imageList])
+    self.colorCode = np.array(pixInfo.get_colorCode(),
+                              dtype=float) / pixels[:,None]
+    self.intenCode = np.array(pixInfo.get_intenCode(),
+                              dtype=float) / pixels[:,None]
+
+    # The snapshot is shared between threads, so make it read-only:
+    for arr in [self.featCols, self.colorCode, self.intenCode]:
+      arr.setflags(write=False)
+
+
+  # Calculate the weight from a list of relevant image indices:
+  def calc_weight(self, relevant):
+
+    n, d = self.normFeatMat.shape
+    return rel_weight(self.normFeatMat[list(relevant)], n, d)
+
+
+  # Find the distance from image i to every image:
+  #   method = any of the ImageViewer methods
+  #   weight = feature weights for the relevance feedback methods,
+  #            1 / N by default
+  #   k      = number of results, all images by default
+  # Returns a list of (index, distance) tuples sorted by distance.
+  def find_distance(self, i, method, weight=None, k=None):
+
+    if method not in colorMethods:
+      return self.find_vec_distance(self.normFeatMat[i], method, weight, k)
+
+    binName = colorMethods[method]
+    binMat = getattr(self, binName)
+    dist = np.sum(np.abs(binMat - binMat[i]), axis=1)
+    return self.sort_distance(dist, k)
+
+
+  # Find the distance from a normalized feature vector to every
+  # image, for the relevance feedback and texture methods:
+  def find_vec_distance(self, featVec, method, weight=None, k=None):
+
+    if method in relMethods:
+      if weight is None:
+        weight = self.calc_weight([])
+
+      # Sum over the features in order, as find_rel_distance does:
+      dist = np.zeros(self.get_size())
+      for j in relMethods[method]:
+        dist += weight[j] * np.abs(self.featCols[j] - featVec[j])
+    elif method in texMethods:
+      tex = texMethods[method]
+      dist = np.abs(self.featCols[tex] - featVec[tex])
+    else:
+      raise ValueError('unknown method: %s' % method)
+    return self.sort_distance(dist, k)
+
+
+  # Give a sorted tuple by distance, ties in index order:
+  def sort_distance(self, dist, k=None):
+
+    order = np.argsort(dist, kind='mergesort')
+    if k is not None:
+      order = order[:k]
+    return [(int(j), float(dist[j])) for j in order]
+
+
+  # Accessor functions:
+  def get_fileList(self):
+    return self.fileList
+
+  def get_normFeatMat(self):
+    return self.normFeatMat
+
+  def get_size(self):
+    return len(self.fileList)
@@ -0,0 +1,249 @@
+#
+#    Copyright (C) <2012>  <cummings.evan@gmail.com>
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# PixShard.py
+# Sharded index over several worker processes.
+#
+# Each shard is a worker process, standing in for a node, with its
+# own PixInfo over a subset of the files.  The Gaussian normalization
+# is rebuilt from the merged per-shard column statistics, so only the
+# statistics move between processes, never the features.  Queries
+# are scattered to every shard and the top k of each are merged.
+# The results are the same as a single PixInfo over all the files.
+
+# Usage:
+#   "python PixShard.py [shards]" builds the sharded index and checks
+#   every query against a single index.
+
+import glob, heapq, sys, time
+from multiprocessing import Process, Pipe
+from PixInfo import PixInfo, merge_stats
+from PixQuery import PixQuery, relMethods, texMethods, rel_weight
+
+
+# Shard worker, builds the index over its files and answers the
+# requests from the coordinator until told to stop.  Image indices
+# in requests and replies are global, gids maps local to global.
+# Each reply is ('ok', result), or ('error', exception) if the
+# request failed, so a bad request does not stop the shard.
+def run_shard(conn, files, gids):
+
+  pixInfo = PixInfo(thumbs=False, files=files, normalize=False)
+  local = dict((gid, l) for l, gid in enumerate(gids))
+  query = None
+  conn.send(('ok', 'ready'))
+
+  while True:
+    request = conn.recv()
+    command = request[0]
+    if command == 'stop':
+      conn.close()
+      return
+
+    try:
+      result = shard_request(pixInfo, query, local, gids, request)
+      if command == 'normalize':
+        query = PixQuery(pixInfo)
+      conn.send(('ok', result))
+    except Exception, e:
+      try:
+        conn.send(('error', e))
+      except Exception:
+        conn.send(('error', RuntimeError('%s: %s' % (type(e).__name__, e))))
+
+
+# Answer one request in a shard worker:
+def shard_request(pixInfo, query, local, gids, request):
+
+  command = request[0]
+  if command == 'stats':
+    return pixInfo.calc_stats()
+  elif command == 'normalize':
+    pixInfo.normalize(request[1])
+    return 'ok'
+  elif command == 'rows':
+    normFeatMat = query.get_normFeatMat()
+    return [normFeatMat[local[gid]].tolist() for gid in request[1]]
+  elif command == 'query':
+    featVec, method, weight, k = request[1:]
+    sortedTup = query.find_vec_distance(featVec, method, weight, k)
+    return [(q, gids[l]) for l, q in sortedTup]
+  raise ValueError('unknown shard request: %s' % command)
+
+
+# Sharded index class.
+class PixShard:
+
+  # Constructor, starts the shards and normalizes over all of them.
+  #   files  = image files, images/*.jpg by default
+  #   shards = number of worker processes
+  def __init__(self, files=None, shards=4):
+
+    if files is None:
+      files = glob.glob('images/*.jpg')
+    self.fileList = list(files)
+    shards = max(1, min(shards, len(self.fileList)))
+
+    # Deal the files out to the shards, the shard and local index
+    # of each global image index:
+    self.owner = [(gid % shards, gid / shards)
+                  for gid in range(len(self.fileList))]
+    self.conns = []
+    self.procs = []
+    for s in range(shards):
+      gids = range(s, len(self.fileList), shards)
+      conn, child = Pipe()
+      proc = Process(target=run_shard,
+                     args=(child, [self.fileList[g] for g in gids], gids))
+      proc.daemon = True
+      proc.start()
+      self.conns.append(conn)
+      self.procs.append(proc)
+    for conn in self.conns:
+      self.receive(conn)
+
+    # Merge the column statistics and normalize each shard:
+    stats = (0, [], [])
+    for shardStats in self.scatter(('stats',)):
+      stats = merge_stats(stats, shardStats)
+    self.scatter(('normalize', stats))
+
+
+  # Send a request to every shard, then gather the replies:
+  def scatter(self, request):
+
+    for conn in self.conns:
+      conn.send(request)
+    replies = [conn.recv() for conn in self.conns]
+    return [self.check_reply(reply) for reply in replies]
+
+
+  # Receive a reply from a shard:
+  def receive(self, conn):
+
+    return self.check_reply(conn.recv())
+
+
+  # The result of a shard reply, raising the shard's exception if
+  # the request failed:
+  def check_reply(self, reply):
+
+    status, result = reply
+    if status == 'error':
+      raise result
+    return result
+
+
+  # Check that an image index is in range:
+  def check_index(self, gid):
+
+    if not 0 <= gid < len(self.fileList):
+      raise IndexError('image index out of range: %d' % gid)
+
+
+  # Normalized features of a list of images, from their shards:
+  def get_rows(self, gids):
+
+    for g in gids:
+      self.check_index(g)
+    rows = {}
+    for s, conn in enumerate(self.conns):
+      shardGids = [g for g in gids if self.owner[g][0] == s]
+      if shardGids:
+        conn.send(('rows', shardGids))
+        rows.update(zip(shardGids, self.receive(conn)))
+    return [rows[g] for g in gids]
+
+
+  # Calculate the weight from a list of relevant image indices:
+  def calc_weight(self, relevant):
+
+    return rel_weight(self.get_rows(relevant), len(self.fileList))
+
+
+  # Find the distance from image i to every image, for the relevance
+  # feedback and texture methods:
+  #   weight = feature weights for the relevance feedback methods,
+  #            1 / N by default
+  #   k      = number of results, all images by default
+  # Returns a list of (index, distance) tuples sorted by distance.
+  def find_distance(self, i, method, weight=None, k=None):
+
+    if method not in relMethods and method not in texMethods:
+      raise ValueError('unknown method: %s' % method)
+    self.check_index(i)
+    if weight is None:
+      weight = self.calc_weight([])
+
+    # Each shard gives its top k sorted by (distance, index), so
+    # merging them gives the same order as a single index:
+    featVec = self.get_rows([i])[0]
+    shardTups = self.scatter(('query', featVec, method, list(weight), k))
+    merged = heapq.merge(*shardTups)
+    sortedTup = [(gid, q) for q, gid in merged]
+    if k is not None:
+      sortedTup = sortedTup[:k]
+    return sortedTup
+
+
+  # Stop the shards:
+  def close(self):
+
+    for conn in self.conns:
+      conn.send(('stop',))
+    for proc in self.procs:
+      proc.join()
+
+
+  # Accessor functions:
+  def get_fileList(self):
+    return self.fileList
+
+  def get_size(self):
+    return len(self.fileList)
+
+
+# Executable section.
+if __name__ == '__main__':
+
+  shards = 4
+  if len(sys.argv) > 1:
+    shards = int(sys.argv[1])
+  files = glob.glob('images/*.jpg')
+
+  t = time.time()
+  pixShard = PixShard(files, shards)
+  print('%d shards built in %.1f s' % (shards, time.time() - t))
+  t = time.time()
+  single = PixQuery(PixInfo(thumbs=False, files=files))
+  print('single index built in %.1f s' % (time.time() - t))
+
+  # Every query, with and without relevance feedback:
+  n = len(files)
+  methods = sorted(relMethods.keys()) + sorted(texMethods.keys())
+  relevant = [0, n / 3, n / 2]
+  same = total = 0
+  for weighted in [False, True]:
+    weight = None
+    if weighted:
+      weight = single.calc_weight(relevant)
+    for method in methods:
+      for i in range(n):
+        total += 1
+        same += (pixShard.find_distance(i, method, weight, 10) ==
+                 single.find_distance(i, method, weight, 10))
+  print('%d of %d top 10 queries match the single index' % (same, total))
+  pixShard.close()
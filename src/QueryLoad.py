@@ -0,0 +1,94 @@
+#
+#    Copyright (C) <2012>  <cummings.evan@gmail.com>
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# QueryLoad.py
+# Load generator for QueryServer.py.
+#
+# A number of client threads send random top-k queries, some with
+# relevance feedback, and the client side throughput and latency
+# are reported along with the server's own /stats.
+
+# Usage:
+#   "python QueryLoad.py [--port 8478] [--clients 8] [--requests 2000]"
+
+import argparse, json, random, threading, time, urllib2
+import numpy as np
+
+methods = ['CC', 'inten', 'energy', 'entropy', 'contrast',
+           'CCT', 'CCI', 'CCTI']
+
+
+# Fetch a URL and decode the JSON reply, POST data if given:
+def get_json(url, data=None):
+
+  return json.loads(urllib2.urlopen(url, data).read())
+
+
+# Client thread, sends count queries and records each latency:
+def run_client(base, n, count, latency, errors, seed):
+
+  rand = random.Random(seed)
+  for c in range(count):
+    url = '%s/query?i=%d&method=%s&k=10' % (base, rand.randrange(n),
+                                           rand.choice(methods))
+    if rand.random() < 0.25:
+      relevant = rand.sample(range(n), 3)
+      url += '&relevant=%s' % ','.join(str(r) for r in relevant)
+    t = time.time()
+    try:
+      get_json(url)
+    except (urllib2.URLError, ValueError):
+      errors.append(url)
+    latency.append(time.time() - t)
+
+
+# Executable section.
+if __name__ == '__main__':
+
+  parser = argparse.ArgumentParser(description='Query server load.')
+  parser.add_argument('--host', default='127.0.0.1')
+  parser.add_argument('--port', type=int, default=8478)
+  parser.add_argument('--clients', type=int, default=8)
+  parser.add_argument('--requests', type=int, default=2000)
+  args = parser.parse_args()
+
+  base = 'http://%s:%d' % (args.host, args.port)
+  n = get_json(base + '/stats')['images']
+  get_json(base + '/reset', '{}')
+  count = args.requests / args.clients
+
+  latency = []
+  errors = []
+  threads = []
+  t = time.time()
+  for c in range(args.clients):
+    thread = threading.Thread(target=run_client,
+                              args=(base, n, count, latency, errors, c))
+    thread.start()
+    threads.append(thread)
+  for thread in threads:
+    thread.join()
+  elapsed = time.time() - t
+
+  latency = 1000 * np.array(latency)
+  print('%d requests, %d errors, %d clients in %.2f s' %
+        (len(latency), len(errors), args.clients, elapsed))
+  print('throughput %.1f req/s' % (len(latency) / elapsed))
+  print('latency ms: mean %.2f  p50 %.2f  p90 %.2f  p99 %.2f' %
+        (np.mean(latency), np.percentile(latency, 50),
+         np.percentile(latency, 90), np.percentile(latency, 99)))
+  print('server: %s' % json.dumps(get_json(base + '/stats'),
+                                  sort_keys=True))
@@ -0,0 +1,266 @@
+#
+#    Copyright (C) <2012>  <cummings.evan@gmail.com>
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# QueryServer.py
+# Local HTTP query server with the index held resident in memory.
+#
+# The PixInfo index is built once at start-up.  Requests are served
+# by a fixed pool of threads from a read-only PixQuery snapshot;
+# adding an image builds a new snapshot and swaps it in, so queries
+# in flight are never blocked by an add.
+
+# Requests (all replies are JSON):
+#   GET  /query?i=3&method=CCTI&k=10
+#        top k images for image i by any ImageViewer method.  For
+#        CCT, CCI and CCTI, relevant=1,5,7 weights the features by
+#        relevance feedback on those images.
+#   POST /add    {"path": "images/101.jpg"}
+#   GET  /stats  request count, throughput and latency over the
+#                recent requests.
+#   POST /reset  clear the statistics, e.g. before a load run.
+
+# Usage:
+#   "python QueryServer.py [--port 8478] [--threads 8]" from the
+#   directory holding images/, then run QueryLoad.py against it.
+
+from BaseHTTPServer import HTTPServer, BaseHTTPRequestHandler
+from SocketServer import ThreadingMixIn
+from Queue import Queue
+import argparse, collections, json, threading, time, urlparse
+import numpy as np
+from PixInfo import PixInfo
+from PixQuery import PixQuery
+
+
+# Thread pool mix-in, requests are queued to a fixed set of worker
+# threads rather than a new thread per request.
+class PoolMixIn(ThreadingMixIn):
+
+  poolSize = 8
+
+  # Start the worker threads:
+  def start_pool(self):
+
+    self.requestQueue = Queue()
+    for i in range(self.poolSize):
+      t = threading.Thread(target=self.process_pool)
+      t.daemon = True
+      t.start()
+
+  # Worker thread, handles requests from the queue forever:
+  def process_pool(self):
+
+    while True:
+      request, client_address = self.requestQueue.get()
+      self.process_request_thread(request, client_address)
+
+  # Queue the request for the pool:
+  def process_request(self, request, client_address):
+
+    self.requestQueue.put((request, client_address))
+
+
+# Query server class.
+class QueryServer(PoolMixIn, HTTPServer):
+
+  # Constructor.
+  #   address  = (host, port) to listen on
+  #   pixInfo  = the index, built without thumbnails
+  #   poolSize = number of worker threads
+  def __init__(self, address, pixInfo, poolSize=8):
+
+    HTTPServer.__init__(self, address, QueryHandler)
+    self.pixInfo = pixInfo
+    self.query = PixQuery(pixInfo)
+    self.addLock = threading.Lock()
+
+    # Finish time and latency of the most recent requests, in
+    # seconds:
+    self.statLock = threading.Lock()
+    self.latency = collections.deque(maxlen=10000)
+    self.count = 0
+
+    self.poolSize = poolSize
+    self.start_pool()
+
+
+  # Add an image to the index and swap in the new snapshot:
+  def add_image(self, infile):
+
+    with self.addLock:
+      self.pixInfo.add_image(infile)
+      self.pixInfo.normalize()
+      self.query = PixQuery(self.pixInfo)
+    return self.query.get_size() - 1
+
+
+  # Record the latency of a request:
+  def record(self, seconds):
+
+    with self.statLock:
+      self.latency.append((time.time(), seconds))
+      self.count += 1
+
+
+  # Clear the statistics:
+  def reset(self):
+
+    with self.statLock:
+      self.latency.clear()
+      self.count = 0
+
+
+  # Request count, and the throughput and latency percentiles in ms
+  # of the recent requests.  The throughput is over the span from the
+  # first to the last of those requests, so idle time before or
+  # after a run does not count:
+  def stats(self):
+
+    with self.statLock:
+      recent = np.array(self.latency).reshape(-1, 2)
+      count = self.count
+    stats = {'requests' : count,
+             'images' : self.query.get_size()}
+    if len(recent) > 0:
+      finish, latency = recent[:,0], recent[:,1]
+      span = finish[-1] - (finish[0] - latency[0])
+      stats['throughput'] = len(recent) / span
+      for p in [50, 90, 99]:
+        stats['p%d_ms' % p] = 1000 * np.percentile(latency, p)
+      stats['mean_ms'] = 1000 * np.mean(latency)
+    return stats
+
+
+# Request handler class.
+class QueryHandler(BaseHTTPRequestHandler):
+
+  # GET requests, queries and statistics:
+  def do_GET(self):
+
+    url = urlparse.urlparse(self.path)
+    params = dict(urlparse.parse_qsl(url.query))
+    if url.path == '/query':
+      self.handle_timed(self.do_query, params)
+    elif url.path == '/stats':
+      self.reply(200, self.server.stats())
+    else:
+      self.reply(404, {'error' : 'unknown path: %s' % url.path})
+
+
+  # POST requests, adding images and clearing the statistics:
+  def do_POST(self):
+
+    url = urlparse.urlparse(self.path)
+    if url.path == '/reset':
+      self.server.reset()
+      self.reply(200, {})
+      return
+    length = int(self.headers.getheader('content-length', 0))
+    try:
+      params = json.loads(self.rfile.read(length))
+    except ValueError:
+      self.reply(400, {'error' : 'invalid JSON'})
+      return
+    if url.path == '/add':
+      self.handle_timed(self.do_add, params)
+    else:
+      self.reply(404, {'error' : 'unknown path: %s' % url.path})
+
+
+  # Run a request, replying with its result or error, and record
+  # the latency.  Bad requests get 400 and any other failure 500,
+  # so the client always gets a reply:
+  def handle_timed(self, func, params):
+
+    t = time.time()
+    try:
+      code, body = 200, func(params)
+    except (KeyError, ValueError, IndexError, IOError), e:
+      code, body = 400, {'error' : str(e)}
+    except Exception, e:
+      code, body = 500, {'error' : '%s: %s' % (type(e).__name__, e)}
+    self.server.record(time.time() - t)
+    self.reply(code, body)
+
+
+  # Top k query, with relevance feedback if relevant is given:
+  def do_query(self, params):
+
+    query = self.server.query
+    i = int(params['i'])
+    method = params.get('method', 'CCTI')
+    k = int(params.get('k', 10))
+    if not 0 <= i < query.get_size():
+      raise IndexError('image index out of range: %d' % i)
+    if k < 1:
+      raise ValueError('k must be positive: %d' % k)
+
+    weight = None
+    relevant = params.get('relevant', '')
+    if relevant:
+      relevant = [int(r) for r in relevant.split(',')]
+      for r in relevant:
+        if not 0 <= r < query.get_size():
+          raise IndexError('relevant index out of range: %d' % r)
+      weight = query.calc_weight(relevant)
+
+    fileList = query.get_fileList()
+    sortedTup = query.find_distance(i, method, weight, k)
+    return {'results' : [[j, fileList[j], q] for j, q in sortedTup]}
+
+
+  # Add an image to the index:
+  def do_add(self, params):
+
+    if not isinstance(params, dict):
+      raise ValueError('request body must be a JSON object')
+    if not isinstance(params.get('path'), basestring):
+      raise ValueError('path must be a string')
+    i = self.server.add_image(params['path'])
+    return {'index' : i}
+
+
+  # Send a JSON reply:
+  def reply(self, code, body):
+
+    data = json.dumps(body)
+    self.send_response(code)
+    self.send_header('Content-Type', 'application/json')
+    self.send_header('Content-Length', str(len(data)))
+    self.end_headers()
+    self.wfile.write(data)
+
+
+  # Quiet the per-request logging, see /stats instead:
+  def log_message(self, format, *args):
+    pass
+
+
+# Executable section.
+if __name__ == '__main__':
+
+  parser = argparse.ArgumentParser(description='Image query server.')
+  parser.add_argument('--host', default='127.0.0.1')
+  parser.add_argument('--port', type=int, default=8478)
+  parser.add_argument('--threads', type=int, default=8)
+  args = parser.parse_args()
+
+  print('Building the index...')
+  pixInfo = PixInfo(thumbs=False)
+  server = QueryServer((args.host, args.port), pixInfo, args.threads)
+  print('Serving %d images on %s:%d' %
+        (len(pixInfo.get_imageList()), args.host, args.port))
+  server.serve_forever()